@@ -1,48 +1,435 @@
-import argparse
-import getpass
+import collections
+import concurrent.futures
+import hashlib
+import json
 import os
+import re
+import shutil
 import subprocess
 import sys
 import tempfile
-from urllib.parse import urlparse
+import threading
+import types
+import warnings
+from email.utils import parsedate_to_datetime
+from urllib.parse import urljoin, urlparse
 
-import requests
+# Chunk size used when streaming images to disk
+CHUNK_SIZE = 1024 * 1024
 
+# Response headers saved next to the image to detect updates
+METADATA_HEADERS = ("ETag", "Last-Modified")
 
-def download_image(url, download_location):
+
+def preallocate(fd, size):
+    """
+    Reserve space for a file of the given size.
+    """
+
+    try:
+        os.posix_fallocate(fd, 0, size)
+    except OSError:
+        # Not every filesystem supports fallocate, just set the size
+        os.ftruncate(fd, size)
+
+
+def create_session(pool_size=8):
+    """
+    Create HTTP session with connection pooling and retries.
+    """
+
+    # requests is slow to import, so it is only imported when downloading
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=pool_size,
+        pool_maxsize=pool_size,
+        max_retries=Retry(
+            total=3, backoff_factor=0.5, status_forcelist=[502, 503, 504]
+        ),
+    )
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    # Cloud images are already compressed
+    session.headers["Accept-Encoding"] = "identity"
+    return session
+
+
+def download_range(session, url, save_path, start, end, stop):
+    """
+    Download bytes start-end of a URL into their place in a file.
+    Stops early when the stop event is set.
+    """
+
+    import requests
+
+    headers = {"Range": f"bytes={start}-{end}"}
+    with session.get(url, headers=headers, stream=True) as response:
+        # Check for status
+        response.raise_for_status()
+        if response.status_code != 206:
+            raise requests.exceptions.RequestException(
+                f"Server ignored range {start}-{end}"
+            )
+        # Write chunks at their offset in the file. Each segment has its own
+        # descriptor, so it stays valid if the download is abandoned
+        fd = os.open(save_path, os.O_WRONLY)
+        try:
+            offset = start
+            for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                if stop.is_set():
+                    return
+                os.pwrite(fd, chunk, offset)
+                offset += len(chunk)
+        finally:
+            os.close(fd)
+
+    if offset != end + 1:
+        raise requests.exceptions.RequestException(f"Incomplete range {start}-{end}")
+
+
+def download_segments(session, url, save_path, parallel):
+    """
+    Download image with parallel HTTP range requests.
+    Returns response headers, or None if the server does not support
+    range requests.
+    """
+
+    # Find out image size and whether ranges are supported
+    response = session.head(url, allow_redirects=True)
+    response.raise_for_status()
+    size = int(response.headers.get("Content-Length", 0))
+    if response.headers.get("Accept-Ranges") != "bytes" or size == 0:
+        return None
+
+    # Split image into equal segments of at least CHUNK_SIZE
+    segments = min(parallel, size // CHUNK_SIZE)
+    if segments < 2:
+        return None
+    segment_size = -(-size // segments)
+
+    fd = os.open(save_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        preallocate(fd, size)
+    finally:
+        os.close(fd)
+
+    stop = threading.Event()
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=segments)
+    try:
+        futures = [
+            executor.submit(
+                download_range,
+                session,
+                url,
+                save_path,
+                start,
+                min(start + segment_size, size) - 1,
+                stop,
+            )
+            for start in range(0, size, segment_size)
+        ]
+        for future in futures:
+            future.result()
+    except BaseException:
+        # Do not wait for the other segments, a file with missing
+        # segments cannot be resumed and is removed
+        stop.set()
+        executor.shutdown(wait=False, cancel_futures=True)
+        os.remove(save_path)
+        raise
+    executor.shutdown()
+
+    return response.headers
+
+
+def download_stream(session, url, save_path):
+    """
+    Download image with a single HTTP request.
+    Returns response headers.
+    """
+
+    import requests
+
+    with session.get(url, stream=True) as response:
+        # Check for status
+        response.raise_for_status()
+        # Let urllib3 undo any Content-Encoding while reading raw stream
+        response.raw.decode_content = True
+        # Remember which version of the image the file holds, so an
+        # interrupted download is only resumed with the same version
+        save_metadata(save_path, response.headers)
+        fd = os.open(save_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        with os.fdopen(fd, "wb", buffering=CHUNK_SIZE) as f:
+            # Reserve space for the image if its size is known
+            content_length = int(response.headers.get("Content-Length", 0))
+            if content_length:
+                preallocate(fd, content_length)
+            try:
+                # Copy the raw stream to file in chunks
+                shutil.copyfileobj(response.raw, f, length=CHUNK_SIZE)
+            finally:
+                # Drop preallocated space the stream did not fill, so
+                # an interrupted download can be resumed
+                f.truncate()
+            written = f.tell()
+
+    if content_length and written != content_length:
+        raise requests.exceptions.RequestException(
+            f"Incomplete download, got {written} of {content_length} bytes"
+        )
+
+    return response.headers
+
+
+def load_metadata(save_path):
+    """
+    Load headers saved with a downloaded image.
+    """
+
+    try:
+        with open(f"{save_path}.meta.json") as file:
+            return json.load(file)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def save_metadata(save_path, headers):
+    """
+    Save headers identifying the version of a downloaded image.
+    """
+
+    metadata = {name: headers[name] for name in METADATA_HEADERS if name in headers}
+    with open(f"{save_path}.meta.json", "w") as file:
+        json.dump(metadata, file)
+
+
+def image_changed(session, url, metadata):
+    """
+    Check with a conditional request whether the image was updated
+    on the server since it was downloaded.
+    """
+
+    headers = {}
+    if "ETag" in metadata:
+        headers["If-None-Match"] = metadata["ETag"]
+    if "Last-Modified" in metadata:
+        headers["If-Modified-Since"] = metadata["Last-Modified"]
+
+    response = session.head(url, headers=headers, allow_redirects=True)
+    if response.status_code == 304:
+        return False
+    response.raise_for_status()
+
+    # Some servers ignore conditional headers, and redirectors send every
+    # request to a different mirror with its own ETag, so only a newer
+    # modification date means the image was updated
+    last_modified = response.headers.get("Last-Modified")
+    if last_modified and "Last-Modified" in metadata:
+        try:
+            return parsedate_to_datetime(last_modified) > parsedate_to_datetime(
+                metadata["Last-Modified"]
+            )
+        except (TypeError, ValueError):
+            return False
+    return "ETag" in metadata and response.headers.get("ETag") != metadata["ETag"]
+
+
+def existing_image_usable(session, url, save_path, filename):
+    """
+    Check whether an already downloaded image can be used as is.
+    """
+
+    # Metadata is only saved for finished downloads, so an
+    # unchanged image does not need to be checked further
+    metadata = load_metadata(save_path)
+    if metadata:
+        if not image_changed(session, url, metadata):
+            return True
+        print(f"Image {filename} was updated, downloading again")
+    elif verify_checksum(session, url, save_path, filename):
+        return True
+    else:
+        print(f"File {save_path} is corrupted, downloading again")
+
+    return False
+
+
+def resume_download(session, url, part_path):
+    """
+    Download the missing end of an interrupted download.
+    Returns response headers, or None if the download cannot be resumed.
+    """
+
+    # Only resume the version of the image the partial file was started with
+    metadata = load_metadata(part_path)
+    validator = metadata.get("ETag")
+    if not validator or validator.startswith("W/"):
+        # Weak ETags cannot be used in If-Range
+        validator = metadata.get("Last-Modified")
+    if not validator:
+        return None
+
+    # Compare size of the partial file with the image size
+    head = session.head(url, allow_redirects=True)
+    head.raise_for_status()
+    size = int(head.headers.get("Content-Length", 0))
+    existing_size = os.path.getsize(part_path)
+    # A killed download can leave a preallocated file that is mostly empty,
+    # so only a file shorter than the image is known to hold written data
+    if not 0 < existing_size < size or head.headers.get("Accept-Ranges") != "bytes":
+        return None
+
+    print(f"Resuming download of {part_path} from byte {existing_size}")
+    # If the image changed, the server answers 200 with the whole new image
+    headers = {"Range": f"bytes={existing_size}-", "If-Range": validator}
+    with session.get(url, headers=headers, stream=True) as response:
+        # Check for status
+        response.raise_for_status()
+        if response.status_code != 206:
+            print(f"Image changed since {part_path} was started")
+            return None
+        # Append the rest of the image to the file
+        with open(part_path, "ab", buffering=CHUNK_SIZE) as f:
+            shutil.copyfileobj(response.raw, f, length=CHUNK_SIZE)
+
+    if os.path.getsize(part_path) != size:
+        return None
+    return response.headers
+
+
+def fetch_checksum(session, url, filename):
+    """
+    Find published checksum of an image next to its URL.
+    Returns hashlib algorithm name and digest, or None if there is none.
+    """
+
+    checksum_urls = [
+        f"{url}.sha256",
+        urljoin(url, "SHA256SUMS"),  # Ubuntu
+        urljoin(url, "SHA512SUMS"),  # Debian
+    ]
+    for checksum_url in checksum_urls:
+        response = session.get(checksum_url)
+        if not response.ok:
+            continue
+        for line in response.text.splitlines():
+            line = line.strip()
+            # Either "<digest> *<filename>" or "SHA256 (<filename>) = <digest>"
+            if match := re.fullmatch(r"([0-9a-fA-F]+)(?:\s+\*?(\S+))?", line):
+                digest, name = match.groups()
+            elif match := re.fullmatch(r"SHA\d+ \((\S+)\) = ([0-9a-fA-F]+)", line):
+                name, digest = match.groups()
+            else:
+                continue
+            if name not in (None, filename):
+                continue
+            algorithm = {64: "sha256", 128: "sha512"}.get(len(digest))
+            if algorithm:
+                return algorithm, digest.lower()
+
+    return None
+
+
+def verify_checksum(session, url, save_path, filename):
     """
-    Download image from a URL to a specified location
+    Check an image against its published checksum.
+    Returns True if they match or no checksum is published.
     """
 
+    checksum = fetch_checksum(session, url, filename)
+    if checksum is None:
+        return True
+
+    algorithm, digest = checksum
+    file_hash = hashlib.new(algorithm)
+    with open(save_path, "rb") as f:
+        while chunk := f.read(CHUNK_SIZE):
+            file_hash.update(chunk)
+
+    return file_hash.hexdigest() == digest
+
+
+def download_image(url, download_location, filename, parallel=1):
+    """
+    Download image from a URL to a specified location.
+    If parallel is greater than 1, the image is downloaded in segments.
+    """
+
+    import requests
+    import urllib3
+
     # Create download path if does not exist
     os.makedirs(download_location, exist_ok=True)
 
-    # Extract filename from URL
-    parsed_url = urlparse(url)
-    filename = os.path.basename(parsed_url.path)
-
-    # Create final save path for the image
+    # Create final save path for the image, the image is downloaded
+    # next to it and only renamed when the download is finished
     save_path = os.path.join(download_location, filename)
-
-    # If the file with the same name already exists, do not download again
-    if os.path.exists(save_path):
-        print(f"File already exists: {save_path}")
-        return
+    part_path = f"{save_path}.part"
 
     try:
-        with requests.get(url, stream=True) as response:
-            # Check for status
-            response.raise_for_status()
-            # Write file in chunks
-            with open(save_path, "wb") as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    f.write(chunk)
+        with create_session(max(parallel, 1)) as session:
+            # If the file with the same name already exists, do not
+            # download again unless it was updated or is corrupted
+            if os.path.exists(save_path):
+                try:
+                    usable = existing_image_usable(session, url, save_path, filename)
+                except (
+                    requests.exceptions.RequestException,
+                    urllib3.exceptions.HTTPError,
+                ) as e:
+                    # Without access to the mirror, use the image on disk
+                    print(
+                        f"Could not check {save_path} on the server, using it as is. {e}"
+                    )
+                    usable = True
+                if usable:
+                    print(f"File already exists: {save_path}")
+                    return
+
+            # Finish an interrupted download
+            headers = None
+            if os.path.exists(part_path):
+                headers = resume_download(session, url, part_path)
+                if headers is not None and not verify_checksum(
+                    session, url, part_path, filename
+                ):
+                    print(f"File {part_path} is corrupted, downloading again")
+                    headers = None
+
+            if headers is None:
+                # Try segmented download first, if requested
+                if parallel > 1:
+                    headers = download_segments(session, url, part_path, parallel)
+                if headers is None:
+                    headers = download_stream(session, url, part_path)
+
+                # Check the new download before it gets the final name
+                if not verify_checksum(session, url, part_path, filename):
+                    os.remove(part_path)
+                    if os.path.exists(f"{part_path}.meta.json"):
+                        os.remove(f"{part_path}.meta.json")
+                    print(f"Image {filename} does not match its published checksum")
+                    sys.exit(1)
+
+            os.replace(part_path, save_path)
+            save_metadata(save_path, headers)
+            if os.path.exists(f"{part_path}.meta.json"):
+                os.remove(f"{part_path}.meta.json")
         print(f"Image {filename} was downloaded to {save_path}")
-    except requests.exceptions.RequestException as e:
+    # Reading the raw stream raises urllib3 errors, not requests ones
+    except (requests.exceptions.RequestException, urllib3.exceptions.HTTPError) as e:
         print(f"Failed to download file. {e}")
         sys.exit(1)
 
 
+# Directories already created by write_cloudinit
+ensured_dirs = set()
+
+
 def write_cloudinit(filename, content, directory="/var/lib/vz/snippets"):
     """
     Write cloud-init configuration to a file.
@@ -52,7 +439,18 @@ def write_cloudinit(filename, content, directory="/var/lib/vz/snippets"):
     path = os.path.join(directory, filename)
 
     # Create directory if does not exist
-    os.makedirs(directory, exist_ok=True)
+    if directory not in ensured_dirs:
+        os.makedirs(directory, exist_ok=True)
+        ensured_dirs.add(directory)
+
+    # Do not rewrite configuration if it has not changed
+    try:
+        with open(path) as file:
+            if file.read() == content:
+                print(f"Cloud-init configuration is up to date: {path}")
+                return
+    except FileNotFoundError:
+        pass
 
     # Write configuration
     with open(path, "w") as file:
@@ -61,7 +459,7 @@ def write_cloudinit(filename, content, directory="/var/lib/vz/snippets"):
 
 
 # Cloud-init configurations
-generic_debian_config = f"""\
+generic_debian_config = """\
 #cloud-config
 packages:
   - qemu-guest-agent
@@ -100,42 +498,179 @@ runcmd:
 """
 
 
-def create_template(url, vm_id, public_ssh_key_path, vm_image, docker):
+def read_file(path):
+    """
+    Read contents of a file as bytes.
+    """
+
+    with open(path, "rb") as file:
+        return file.read()
+
+
+def run_command(command, message, error_message):
+    """
+    Run a command, exiting with its error output if it fails.
+    """
+
+    try:
+        print(message)
+        subprocess.run(
+            command, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE
+        )
+    except subprocess.CalledProcessError as e:
+        print(f"{error_message}: {e}")
+        print("Error output:", e.stderr)
+        sys.exit(1)
+
+
+def stream_command(command, message, error_message):
+    """
+    Run a command, printing its output as it arrives.
+    Only the last lines of output are kept for the error message.
+    """
+
+    print(message)
+    with subprocess.Popen(
+        command,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+        bufsize=1,
+    ) as process:
+        output = collections.deque(maxlen=1024)
+        for line in process.stdout:
+            print(line, end="")
+            output.append(line)
+
+    if process.returncode != 0:
+        e = subprocess.CalledProcessError(process.returncode, command)
+        print(f"{error_message}: {e}")
+        print("Error output:", "".join(output))
+        sys.exit(1)
+
+
+def hash_password(password):
+    """
+    Generate SHA-512 crypt hash of a password.
+    Uses `openssl passwd` if Python's crypt module is not available.
+    """
+
+    try:
+        # crypt is deprecated since Python 3.11, do not warn user about it
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", DeprecationWarning)
+            import crypt
+
+        hashed_password = crypt.crypt(password, crypt.mksalt(crypt.METHOD_SHA512))
+    except ImportError:
+        # crypt was removed in Python 3.13 and is missing on some platforms
+        hashed_password = None
+
+    if hashed_password is None:
+        hashed_password = subprocess.check_output(
+            ["openssl", "passwd", "-6", password], text=True
+        ).strip()
+
+    return hashed_password
+
+
+# Options of `qm create` common for all VMs
+CREATE_OPTIONS = (
+    "--ostype=l26",
+    "--memory=1024",
+    "--agent=1",
+    "--cpu=host",
+    "--socket=1",
+    "--cores=1",
+    "--vga=serial0",
+    "--serial0=socket",
+    "--net0",
+    "virtio,bridge=vmbr0,tag=20",  # VLAN ID of my servers
+)
+
+# Options of `qm set` common for all VMs
+SET_OPTIONS = (
+    "--scsihw=virtio-scsi-pci",
+    "--boot",
+    "order=virtio0",
+    "--scsi1=local-zfs:cloudinit",
+    "--ciuser=artur",
+    "--ipconfig0",
+    "ip=dhcp",
+)
+
+# Options of `qm set` with template name, cloud-init snippet and tags for each OS
+PROFILES = {
+    "ubuntu": (
+        "--name=ubuntu-2404-cloudinit-template",  # When new Ubuntu comes out, it needs to be changed
+        "--cicustom",
+        "vendor=local:snippets/debian-cloudinit.yaml",
+        "--tags=ubuntu,cloudinit",
+    ),
+    "ubuntu-docker": (
+        "--name=ubuntu-2404-cloudinit-docker-template",
+        "--cicustom",
+        "vendor=local:snippets/ubuntu-docker-cloudinit.yaml",
+        "--tags=ubuntu,cloudinit,docker",
+    ),
+    "debian": (
+        "--name=debian-bookworm-cloudinit-template",
+        "--cicustom",
+        "vendor=local:snippets/debian-cloudinit.yaml",
+        "--tags=debian,cloudinit",
+    ),
+    "fedora": (
+        "--name=fedora-41-cloudinit-template",
+        "--cicustom",
+        "vendor=local:snippets/fedora-cloudinit.yaml",
+        "--tags=fedora,cloudinit",
+    ),
+}
+
+
+def classify_image(filename):
+    """
+    Get OS of an image from its filename.
+    Returns None if the OS is not supported.
+    """
+
+    filename = filename.lower()
+    if "noble" in filename:
+        return "ubuntu"
+    elif "debian" in filename:
+        return "debian"
+    elif "fedora" in filename:
+        return "fedora"
+    return None
+
+
+def create_template(os_kind, vm_id, public_ssh_key_path, vm_image, docker):
     """
     Create template using Proxmox's `qm` commands.
     If docker is enabled, creates an Ubuntu VM template with pre-installed Docker.
     """
 
-    # Parse url
-    parsed_url = urlparse(url)
+    # Collect all public SSH keys, `qm set --sshkeys` accepts a single file
+    try:
+        ssh_keys = b"\n".join(read_file(path).rstrip() for path in public_ssh_key_path)
+    except OSError as e:
+        print(f"Failed to read public SSH key. {e}")
+        sys.exit(1)
 
-    # Extract OS type from the parse url
-    os_type = os.path.basename(parsed_url.path).lower()
+    import getpass
 
     # As user for password
     vm_password = getpass.getpass("Enter the password for VM: ")
 
     # Generate password hash
-    hashed_vm_password = subprocess.check_output(
-        ["openssl", "passwd", "-6", vm_password], text=True
-    ).strip()
+    hashed_vm_password = hash_password(vm_password)
+
+    # Write SSH keys to a single file for cloud-init
+    with tempfile.NamedTemporaryFile(suffix=".pub", delete=False) as ssh_keys_file:
+        ssh_keys_file.write(ssh_keys + b"\n")
 
     # Common command for all VMs
-    create_command = [
-        "qm",
-        "create",
-        vm_id,
-        "--ostype=l26",
-        "--memory=1024",
-        "--agent=1",
-        "--cpu=host",
-        "--socket=1",
-        "--cores=1",
-        "--vga=serial0",
-        "--serial0=socket",
-        "--net0",
-        "virtio,bridge=vmbr0,tag=20",  # VLAN ID of my servers
-    ]
+    create_command = ["qm", "create", vm_id, *CREATE_OPTIONS]
 
     importdisk_command = ["qm", "importdisk", vm_id, vm_image, "local-zfs"]
 
@@ -143,113 +678,60 @@ def create_template(url, vm_id, public_ssh_key_path, vm_image, docker):
         "qm",
         "set",
         vm_id,
-        "--scsihw=virtio-scsi-pci",
         f"--virtio0=local-zfs:vm-{vm_id}-disk-0,discard=on",  # I use local-zfs volume
-        "--boot",
-        "order=virtio0",
-        "--scsi1=local-zfs:cloudinit",
-        "--ciuser=artur",
+        *SET_OPTIONS,
         "--sshkeys",
-        " ".join(public_ssh_key_path),
+        ssh_keys_file.name,
         "--cipassword",
         hashed_vm_password,
-        "--ipconfig0",
-        "ip=dhcp",
     ]
 
     template_command = ["qm", "template", vm_id]
 
-    # Set command for Ubuntu machine
-    if "noble" in os_type:
-        if docker:
-            set_command.extend(
-                [
-                    "--name=ubuntu-2404-cloudinit-docker-template",
-                    "--cicustom",
-                    "vendor=local:snippets/ubuntu-docker-cloudinit.yaml",
-                    "--tags=ubuntu,cloudinit,docker",
-                ]
-            )
-        else:
-            set_command.extend(
-                [
-                    "--name=ubuntu-2404-cloudinit-template",  # When new Ubuntu comes out, it needs to be changed
-                    "--cicustom",
-                    "vendor=local:snippets/debian-cloudinit.yaml",
-                    "--tags=ubuntu,cloudinit",
-                ]
-            )
-
-    # Set command for Debian machine
-    elif "debian" in os_type:
-        if docker:
-            print(
-                "Debian with Docker not supported. Proceeding with normal Debian installation"
-            )
-
-        set_command.extend(
-            [
-                "--name=debian-bookworm-cloudinit-template",
-                "--cicustom",
-                "vendor=local:snippets/debian-cloudinit.yaml",
-                "--tags=debian,cloudinit",
-            ]
-        )
-
-    # Set command for Fedora machine
-    elif "fedora" in os_type:
-        if docker:
+    # Set name, cloud-init snippet and tags for the OS
+    profile = os_kind
+    if docker:
+        if f"{os_kind}-docker" in PROFILES:
+            profile = f"{os_kind}-docker"
+        elif os_kind in PROFILES:
+            name = os_kind.capitalize()
             print(
-                "Fedora with Docker not supported. Proceeding with normal Fedora installation"
+                f"{name} with Docker not supported. Proceeding with normal {name} installation"
             )
 
-        set_command.extend(
-            [
-                "--name=fedora-41-cloudinit-template",
-                "--cicustom",
-                "vendor=local:snippets/fedora-cloudinit.yaml",
-                "--tags=fedora,cloudinit",
-            ]
-        )
+    if profile in PROFILES:
+        set_command.extend(PROFILES[profile])
 
     # Create VMs with Python's subprocess
     try:
-        print(f"Creating VM {vm_id}...")
-        subprocess.run(create_command, check=True, capture_output=True)
-    except subprocess.CalledProcessError as e:
-        print(f"Error creating VM: {e}")
-        print("Error output:", e.stderr)
-        sys.exit(1)
+        run_command(create_command, f"Creating VM {vm_id}...", "Error creating VM")
+        stream_command(importdisk_command, "Importing disk...", "Error importing disk")
+        run_command(set_command, "Configuring VM...", "Error configuring VM")
+        run_command(template_command, "Creating template...", "Error creating template")
+    finally:
+        os.remove(ssh_keys_file.name)
 
-    try:
-        print(f"Importing disk...")
-        subprocess.run(importdisk_command, check=True, capture_output=True)
-    except subprocess.CalledProcessError as e:
-        print(f"Error importing disk: {e}")
-        print("Error output:", e.stderr)
-        sys.exit(1)
+    print(f"Template {vm_id} successfully created.")
 
-    try:
-        print("Configuring VM...")
-        subprocess.run(set_command, check=True, capture_output=True)
-    except subprocess.CalledProcessError as e:
-        print(f"Error configuring VM: {e}")
-        print("Error output:", e.stderr)
-        sys.exit(1)
 
-    try:
-        print("Creating template...")
-        subprocess.run(template_command, check=True, capture_output=True)
-    except subprocess.CalledProcessError as e:
-        print(f"Error creating template: {e}")
-        print("Error output:", e.stderr)
-        sys.exit(1)
+# Arguments of the last run, reused with --from-cache
+ARGS_CACHE_PATH = os.path.join(
+    os.environ.get("XDG_CONFIG_HOME", os.path.expanduser("~/.config")),
+    "create_proxmox_templates",
+    "last.json",
+)
 
-    print(f"Template {vm_id} successfully created.")
 
+def parse_args():
+    """
+    Parse CLI arguments.
+    """
+
+    # Only needed when arguments are not loaded from cache
+    import argparse
 
-def main():
-    parser = argparse.ArgumentParser()
+    # Abbreviations are disabled, main() looks for the exact --from-cache
+    parser = argparse.ArgumentParser(allow_abbrev=False)
 
     # Add CLI arguments
     parser.add_argument("-u", "--url", help="Direct url to the image")
@@ -267,32 +749,111 @@ def main():
         action=argparse.BooleanOptionalAction,
         help="If specified, creates an Ubuntu VM template with pre-installed Docker.",
     )
-    args = parser.parse_args()
-
-    # Download the image
-    download_image(args.url, args.download_location)
-
-    # Write cloud-init configurations
-    write_cloudinit(
-        filename="debian-cloudinit.yaml",
-        content=generic_debian_config,
-    )
-    write_cloudinit(
-        filename="ubuntu-docker-cloudinit.yaml",
-        content=ubuntu_docker_config,
+    parser.add_argument(
+        "--parallel",
+        type=int,
+        default=1,
+        help="Number of parallel connections for downloading the image",
     )
-    write_cloudinit(
-        filename="fedora-cloudinit.yaml",
-        content=fedora_config,
+    parser.add_argument(
+        "--from-cache",
+        action="store_true",
+        help="Reuse arguments of the last run. Cannot be combined with other arguments",
     )
+    return parser.parse_args()
+
+
+def load_cached_args():
+    """
+    Load arguments of the last run.
+    """
+
+    try:
+        with open(ARGS_CACHE_PATH) as file:
+            return types.SimpleNamespace(**json.load(file))
+    except (OSError, ValueError) as e:
+        print(f"Failed to load cached arguments. {e}")
+        sys.exit(1)
+
 
-    # Get the filename to be used for VM image creation
+def save_cached_args(args):
+    """
+    Save arguments to be reused with --from-cache.
+    """
+
+    # Store absolute paths, so the cache works from any directory
+    cached_args = vars(args).copy()
+    if args.download_location:
+        cached_args["download_location"] = os.path.abspath(args.download_location)
+    if args.public_ssh_key_path:
+        cached_args["public_ssh_key_path"] = [
+            os.path.abspath(path) for path in args.public_ssh_key_path
+        ]
+
+    # Failing to save the cache should not stop creating the template
+    try:
+        os.makedirs(os.path.dirname(ARGS_CACHE_PATH), exist_ok=True)
+        with open(ARGS_CACHE_PATH, "w") as file:
+            json.dump(cached_args, file)
+    except OSError as e:
+        print(f"Failed to save arguments for --from-cache. {e}")
+
+
+def main():
+    # Reuse arguments of the last run without parsing CLI arguments
+    if "--from-cache" in sys.argv[1:]:
+        if len(sys.argv) > 2:
+            print("--from-cache cannot be combined with other arguments")
+            sys.exit(1)
+        args = load_cached_args()
+    else:
+        args = parse_args()
+        save_cached_args(args)
+
+    # Get the filename and OS to be used for VM image creation
     parsed_url = urlparse(args.url)
     filename = os.path.basename(parsed_url.path)
+    os_kind = classify_image(filename)
+
+    # Write cloud-init configurations in the background while the image
+    # is downloaded in the main thread, so Ctrl-C still stops the download
+    with concurrent.futures.ThreadPoolExecutor(max_workers=3) as executor:
+        futures = [
+            executor.submit(
+                write_cloudinit,
+                filename="debian-cloudinit.yaml",
+                content=generic_debian_config,
+            ),
+            executor.submit(
+                write_cloudinit,
+                filename="ubuntu-docker-cloudinit.yaml",
+                content=ubuntu_docker_config,
+            ),
+            executor.submit(
+                write_cloudinit,
+                filename="fedora-cloudinit.yaml",
+                content=fedora_config,
+            ),
+        ]
+
+        # Download the image
+        download_image(
+            url=args.url,
+            download_location=args.download_location,
+            filename=filename,
+            parallel=args.parallel,
+        )
+
+    # Stop if any of the configurations could not be written
+    for future in futures:
+        e = future.exception()
+        if e is not None:
+            print(f"Failed to write cloud-init configuration. {e}")
+            sys.exit(1)
 
     # Create VM template
     create_template(
-        url=args.url,
+        os_kind=os_kind,
         vm_id=args.vm_id,
         vm_image=os.path.join(args.download_location, filename),
         public_ssh_key_path=args.public_ssh_key_path,